@@ -1,32 +1,60 @@
 from mcp.server.fastmcp import FastMCP
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import os
+import gzip
+import hashlib
+import importlib.util
 import httpx
-import json
+import orjson
 from typing import List, Dict, Any
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from collections import deque
+from dataclasses import dataclass
+import itertools
 import uvicorn
-import threading
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 import time
 import asyncio
-import aiohttp
-import requests
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
 
+# Logger do servidor (sem saída por padrão; a saída é configurada no __main__)
+logger = logging.getLogger("rpg_mcp")
+logger.addHandler(logging.NullHandler())
+
 # Create an MCP server
 mcp = FastMCP("RPG Gemini Server")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Fecha o cliente HTTP compartilhado da API Gemini ao encerrar o servidor"""
+    yield
+    await _gemini_client.aclose()
+
 # Create FastAPI app for HTTP endpoints
-app = FastAPI(title="RPG Gemini Hybrid Server")
+app = FastAPI(title="RPG Gemini Hybrid Server", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Global variable to store MCP tools results
 mcp_results = {}
 
+# Cliente HTTP compartilhado para a API Gemini (mantém conexões keep-alive entre chamadas).
+# Com o pacote h2 instalado (httpx[http2]) as chamadas simultâneas são multiplexadas em HTTP/2
+_gemini_client = httpx.AsyncClient(
+    timeout=30.0,
+    http2=importlib.util.find_spec("h2") is not None,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50, keepalive_expiry=60)
+)
+# O httpx registra cada requisição (com a URL completa) em INFO; só avisos e erros interessam
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
 # Modelos Pydantic para validação de dados
 class MessagePart(BaseModel):
     text: str
@@ -38,7 +66,29 @@ class Message(BaseModel):
 class GeminiRequest(BaseModel):
     contents: List[Message]
 
+class MoveRequest(BaseModel):
+    destination: str = Field(min_length=1)
+
+class PensamentoRequest(BaseModel):
+    texto: str = Field(min_length=1)
+
+class ExecuteJsRequest(BaseModel):
+    script: str = Field(min_length=1)
+
+# Nome de cada localização pelo tile do mapa ('h' é a casa do jogador no layout, 'H' depois de desenhada).
+# Espelha o tileToLocation do index.html
+TILE_TO_LOCATION = {
+    'H': 'casa',
+    'h': 'casa',
+    'B': 'banco',
+    'M': 'mercado',
+    'W': 'trabalho',
+    'C': 'loja_carros'
+}
+
 # Função para detectar coordenadas dos destinos no mapa
+# O layout é constante, então o resultado é calculado uma única vez
+@lru_cache(maxsize=1)
 def detect_map_coordinates():
     """Detecta automaticamente as coordenadas dos destinos no mapa"""
     map_layout = [
@@ -54,23 +104,35 @@ def detect_map_coordinates():
         "####################",
     ]
     
-    destinations = {}
+    # Busca cada tile com str.find no mapa inteiro (todas as linhas têm a mesma largura)
+    joined = "\n".join(map_layout)
+    width = len(map_layout[0]) + 1
     
-    for y, row in enumerate(map_layout):
-        for x, tile in enumerate(row):
-            if tile == 'h':  # Casa do jogador
-                destinations["casa"] = {"x": x, "y": y}
-            elif tile == 'W':  # Trabalho
-                destinations["trabalho"] = {"x": x, "y": y}
-            elif tile == 'M':  # Mercado
-                destinations["mercado"] = {"x": x, "y": y}
-            elif tile == 'B':  # Banco
-                destinations["banco"] = {"x": x, "y": y}
-            elif tile == 'C':  # Loja de Carros
-                destinations["loja_carros"] = {"x": x, "y": y}
+    destinations = {}
+    for tile, name in TILE_TO_LOCATION.items():
+        idx = joined.find(tile)
+        if idx >= 0:
+            destinations[name] = {"x": idx % width, "y": idx // width}
     
     return destinations
 
+# Resposta de get_destinations pré-calculada (o mapa não muda em tempo de execução)
+_DESTINATIONS_RESULT = {
+    "destinations": detect_map_coordinates(),
+    "message": "Coordenadas detectadas automaticamente do mapa"
+}
+_DESTINATIONS_BODY = orjson.dumps(_DESTINATIONS_RESULT)
+_DESTINATIONS_JSON = _DESTINATIONS_BODY.decode()
+
+# As ferramentas MCP precisam retornar strings JSON; a lógica fica em funções que
+# retornam dicts para que os endpoints HTTP não precisem serializar e re-parsear o resultado.
+def _get_config_dict() -> dict:
+    """Monta as configurações do frontend"""
+    return {
+        "gemini_api_available": bool(os.getenv("GEMINI_API_KEY")),
+        "message": "API Gemini configurada via backend"
+    }
+
 @mcp.tool()
 def get_config() -> str:
     """Retorna as configurações necessárias para o frontend do jogo RPG.
@@ -78,11 +140,7 @@ def get_config() -> str:
     Returns:
         str: JSON com informações sobre disponibilidade da API Gemini
     """
-    config = {
-        "gemini_api_available": bool(os.getenv("GEMINI_API_KEY")),
-        "message": "API Gemini configurada via backend"
-    }
-    return json.dumps(config)
+    return orjson.dumps(_get_config_dict()).decode()
 
 @mcp.tool()
 def get_destinations() -> str:
@@ -91,99 +149,90 @@ def get_destinations() -> str:
     Returns:
         str: JSON com as coordenadas dos destinos (casa, trabalho, mercado)
     """
-    destinations = detect_map_coordinates()
-    result = {
-        "destinations": destinations,
-        "message": "Coordenadas detectadas automaticamente do mapa"
-    }
-    return json.dumps(result)
+    return _DESTINATIONS_JSON
 
-@mcp.tool()
-def generate_gemini_content(contents_json: str) -> str:
-    """Executa uma chamada para a API Gemini para gerar conteúdo baseado nas mensagens fornecidas.
-    
-    Args:
-        contents_json (str): JSON string contendo a lista de mensagens no formato [{"role": "user", "parts": [{"text": "mensagem"}]}]
-    
-    Returns:
-        str: JSON com a resposta da API Gemini ou erro
-    """
+async def _generate_gemini_content_dict(contents: list) -> dict:
+    """Chama a API Gemini com a lista de mensagens e retorna a resposta ou o erro"""
     try:
         # Verifica se a API key está configurada
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
-            return json.dumps({
+            return {
                 "error": "GEMINI_API_KEY não configurada no arquivo .env",
                 "status_code": 500
-            })
-        
-        # Parse do JSON de entrada
-        contents = json.loads(contents_json)
+            }
         
-        # URL da API Gemini
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={api_key}"
+        # URL da API Gemini (a chave vai no cabeçalho x-goog-api-key, nunca na URL, que aparece em logs)
+        api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent"
         
         # Prepara o payload
         payload = {"contents": contents}
         
-        # Faz a chamada para a API Gemini usando requests síncronos
-        import requests
-        response = requests.post(
+        # Faz a chamada para a API Gemini usando o cliente assíncrono compartilhado.
+        # O corpo é serializado com orjson (UTF-8 direto, sem escapar acentos e emojis como \uXXXX)
+        response = await _gemini_client.post(
             api_url,
-            headers={"Content-Type": "application/json"},
-            json=payload,
-            timeout=30.0
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json", "x-goog-api-key": api_key}
         )
         
-        if not response.ok:
-            return json.dumps({
+        if not response.is_success:
+            return {
                 "error": f"Erro na API Gemini: {response.status_code} - {response.text}",
                 "status_code": response.status_code
-            })
+            }
         
-        result = response.json()
+        result = orjson.loads(response.content)
         
         # Extrai a resposta da API
         if "candidates" in result and len(result["candidates"]) > 0:
             ai_response = result["candidates"][0]["content"]["parts"][0]["text"]
-            return json.dumps({"response": ai_response})
+            return {"response": ai_response}
         else:
-            return json.dumps({
+            return {
                 "error": "Resposta inválida da API Gemini",
                 "status_code": 500
-            })
+            }
             
-    except json.JSONDecodeError:
-        return json.dumps({
-            "error": "JSON inválido fornecido",
-            "status_code": 400
-        })
-    except requests.exceptions.Timeout:
-        return json.dumps({
+    except httpx.TimeoutException:
+        return {
             "error": "Timeout na chamada da API Gemini",
             "status_code": 408
-        })
-    except requests.exceptions.RequestException as e:
-        return json.dumps({
+        }
+    except httpx.RequestError as e:
+        return {
             "error": f"Erro de conexão com a API Gemini: {str(e)}",
             "status_code": 500
-        })
+        }
     except Exception as e:
-        return json.dumps({
+        return {
             "error": f"Erro interno: {str(e)}",
             "status_code": 500
-        })
+        }
 
 @mcp.tool()
-def move_player(destination: str) -> str:
-    """Move o player para um destino específico no jogo RPG usando pathfinding.
+async def generate_gemini_content(contents_json: str) -> str:
+    """Executa uma chamada para a API Gemini para gerar conteúdo baseado nas mensagens fornecidas.
     
     Args:
-        destination (str): O destino para onde mover o player (casa, trabalho, mercado, banco)
+        contents_json (str): JSON string contendo a lista de mensagens no formato [{"role": "user", "parts": [{"text": "mensagem"}]}]
     
     Returns:
-        str: JSON com sucesso/erro, coordenadas do destino e status do player
+        str: JSON com a resposta da API Gemini ou erro
     """
+    try:
+        # Parse do JSON de entrada
+        contents = orjson.loads(contents_json)
+    except orjson.JSONDecodeError:
+        return orjson.dumps({
+            "error": "JSON inválido fornecido",
+            "status_code": 400
+        }).decode()
+    
+    return orjson.dumps(await _generate_gemini_content_dict(contents)).decode()
+
+def _move_player_dict(destination: str) -> dict:
+    """Dispara o movimento do player no frontend e retorna o resultado"""
     try:
         # Detecta automaticamente as coordenadas dos destinos
         destinations = detect_map_coordinates()
@@ -191,80 +240,103 @@ def move_player(destination: str) -> str:
         destination_lower = destination.lower()
         
         if destination_lower not in destinations:
-            return json.dumps({
+            return {
                 "success": False,
                 "message": f"Destino '{destination}' não encontrado. Destinos disponíveis: {', '.join(destinations.keys())}"
-            })
+            }
         
         target_position = destinations[destination_lower]
         
-        # Executa o movimento visual no frontend
-        try:
-            import asyncio
-            import aiohttp
-            
-            async def trigger_frontend_movement():
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        # Chama o endpoint que executa JavaScript no frontend
-                        await session.post('http://127.0.0.1:8080/api/execute-js', 
-                                         json={'script': f'window.mcpMovePlayer("{destination_lower}")'})
-                except:
-                    pass  # Ignora erros de conexão
-            
-            # Executa de forma assíncrona sem bloquear
-            try:
-                loop = asyncio.get_event_loop()
-                loop.create_task(trigger_frontend_movement())
-            except:
-                # Se não há loop, cria um novo
-                asyncio.run(trigger_frontend_movement())
-                
-        except Exception as js_error:
-            # Se falhar a execução do JavaScript, continua normalmente
-            pass
+        # Enfileira o movimento visual para o frontend
+        frontend_triggered = enqueue_js_command(f'window.mcpMovePlayer("{destination_lower}")')
         
         # Retorna sucesso e deixa o frontend usar findPath para calcular o caminho
-        return json.dumps({
+        return {
             "success": True,
             "message": f"Executando movimento para {destination_lower}...",
             "new_position": target_position,
-            "frontend_triggered": True,
+            "frontend_triggered": frontend_triggered,
             "player_status": {
                 "destination": destination_lower,
                 "target_coordinates": target_position,
                 "movement_type": "pathfinding",
                 "status": "moving"
             }
-        })
+        }
         
     except Exception as e:
-        return json.dumps({
+        return {
             "success": False,
             "message": f"Erro ao mover player: {str(e)}"
-        })
+        }
 
 @mcp.tool()
-def get_player_status() -> str:
+def move_player(destination: str) -> str:
+    """Move o player para um destino específico no jogo RPG usando pathfinding.
+    
+    Args:
+        destination (str): O destino para onde mover o player (casa, trabalho, mercado, banco)
+    
+    Returns:
+        str: JSON com sucesso/erro, coordenadas do destino e status do player
+    """
+    return orjson.dumps(_move_player_dict(destination)).decode()
+
+async def _get_player_status_dict() -> dict:
+    """Obtém o status do player capturado em tempo real no jogo em execução"""
+    # Captura direto em memória, sem requisição HTTP para o próprio servidor
+    payload, _, _ = await _live_status()
+    return payload
+
+@mcp.tool()
+async def get_player_status() -> str:
     """Get player status with stamina, pocket money, bank money, coordinates and current location from the running game"""
-    import requests
+    return orjson.dumps(await _get_player_status_dict()).decode()
+
+# JavaScript para criar um balão de pensamento para o player (%s recebe o texto como literal JSON)
+_PENSAMENTO_TMPL = """
+if (typeof startDialogue === 'function' && typeof playerPosition !== 'undefined') {
+    const texto = %s;
+    
+    // Cria um objeto temporário para representar o player como personagem
+    const playerCharacter = {
+        name: 'Você',
+        x: playerPosition.x,
+        y: playerPosition.y
+    };
     
+    // Cria a sequência de diálogo com o pensamento
+    const thoughtSequence = [{ text: '💭 ' + texto }];
+    
+    // Inicia o diálogo como um pensamento temporizado
+    startDialogue(thoughtSequence, playerCharacter, true, false, []);
+    
+    console.log('Pensamento exibido:', texto);
+} else {
+    console.error('Função startDialogue não encontrada ou playerPosition indefinido');
+}
+"""
+
+def _pensamento_dict(texto: str) -> dict:
+    """Envia o pensamento para o frontend e retorna o resultado"""
     try:
-        # Faz uma requisição para o endpoint de status
-        response = requests.get('http://127.0.0.1:8080/api/get-player-status-live')
-        if response.status_code == 200:
-            return response.text
-        else:
-            # Fallback para o último status conhecido
-            return json.dumps({
-                "player_status": last_player_status
-            }, ensure_ascii=False)
+        # Monta o script a partir do template; json escapa aspas e quebras de linha do texto
+        js_script = _PENSAMENTO_TMPL % orjson.dumps(texto).decode()
+        
+        # Enfileira o pensamento para o frontend
+        enqueue_js_command(js_script)
+        
+        return {
+            "success": True,
+            "message": f"Pensamento '{texto}' exibido com sucesso",
+            "texto": texto
+        }
+        
     except Exception as e:
-        # Em caso de erro, retorna o último status conhecido
-        return json.dumps({
-            "player_status": last_player_status,
-            "error": str(e)
-        }, ensure_ascii=False)
+        return {
+            "success": False,
+            "message": f"Erro ao exibir pensamento: {str(e)}"
+        }
 
 @mcp.tool()
 def pensamento(texto: str) -> str:
@@ -276,170 +348,129 @@ def pensamento(texto: str) -> str:
     Returns:
         str: JSON com sucesso/erro da operação
     """
-    try:
-        # JavaScript para criar um balão de pensamento para o player
-        js_script = f"""
-        if (typeof startDialogue === 'function' && typeof playerPosition !== 'undefined') {{
-            // Cria um objeto temporário para representar o player como personagem
-            const playerCharacter = {{
-                name: 'Você',
-                x: playerPosition.x,
-                y: playerPosition.y
-            }};
-            
-            // Cria a sequência de diálogo com o pensamento
-            const thoughtSequence = [{{ text: '💭 {texto}' }}];
-            
-            // Inicia o diálogo como um pensamento temporizado
-            startDialogue(thoughtSequence, playerCharacter, true, false, []);
-            
-            console.log('Pensamento exibido:', '{texto}');
-        }} else {{
-            console.error('Função startDialogue não encontrada ou playerPosition indefinido');
-        }}
-        """
-        
-        # Executa o JavaScript no frontend de forma assíncrona
-        async def trigger_thought():
-            try:
-                async with aiohttp.ClientSession() as session:
-                    await session.post('http://127.0.0.1:8080/api/execute-js', 
-                                     json={'script': js_script})
-            except:
-                pass  # Ignora erros de conexão
-        
-        # Executa de forma assíncrona sem bloquear
+    return orjson.dumps(_pensamento_dict(texto)).decode()
+
+# HTML do jogo carregado uma única vez no import (e sua versão gzip pré-comprimida)
+try:
+    with open("index.html", "rb") as f:
+        _GAME_HTML: bytes | None = f.read()
+    _GAME_HTML_GZIP: bytes | None = gzip.compress(_GAME_HTML, 9)
+except FileNotFoundError:
+    _GAME_HTML = None
+    _GAME_HTML_GZIP = None
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Verifica se o Accept-Encoding aceita gzip (ignora gzip;q=0)"""
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() != "gzip":
+            continue
+        
+        key, _, value = params.strip().partition("=")
+        if key.strip().lower() != "q":
+            return True
         try:
-            loop = asyncio.get_event_loop()
-            loop.create_task(trigger_thought())
-        except:
-            # Se não há loop, cria um novo
-            asyncio.run(trigger_thought())
-        
-        return json.dumps({
-            "success": True,
-            "message": f"Pensamento '{texto}' exibido com sucesso",
-            "texto": texto
-        })
-        
-    except Exception as e:
-        return json.dumps({
-            "success": False,
-            "message": f"Erro ao exibir pensamento: {str(e)}"
-        })
+            return float(value) > 0
+        except ValueError:
+            return False
+    return False
 
 # FastAPI endpoints that bridge to MCP tools
 @app.get("/", response_class=HTMLResponse)
-async def serve_game():
+async def serve_game(request: Request):
     """Serve the RPG game HTML"""
-    try:
-        with open("index.html", "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
+    if _GAME_HTML is None:
         raise HTTPException(status_code=404, detail="Game file not found")
+    
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        return HTMLResponse(
+            content=_GAME_HTML_GZIP,
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        )
+    return HTMLResponse(content=_GAME_HTML, headers={"Vary": "Accept-Encoding"})
+
+def _etag(body: bytes) -> str:
+    """Calcula um ETag forte para o corpo da resposta"""
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+def _cached_json_response(request: Request, body: bytes, etag: str, cache_control: str) -> Response:
+    """Retorna o JSON pré-serializado, ou 304 se o navegador já tem esta versão"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Config e destinos são fixos enquanto o processo roda (o .env é lido no import),
+# então são serializados uma única vez junto com seus ETags
+_CONFIG_BODY = orjson.dumps(_get_config_dict())
+_CONFIG_ETAG = _etag(_CONFIG_BODY)
+_DESTINATIONS_ETAG = _etag(_DESTINATIONS_BODY)
 
 @app.get("/api/config")
-async def get_config_endpoint():
-    """HTTP endpoint that calls MCP get_config tool"""
-    result = get_config()
-    return json.loads(result)
+async def get_config_endpoint(request: Request):
+    """HTTP endpoint that calls MCP get_config tool logic"""
+    # no-cache: o navegador sempre revalida, já que a config pode mudar ao reiniciar o servidor
+    return _cached_json_response(request, _CONFIG_BODY, _CONFIG_ETAG, "no-cache")
 
 @app.get("/api/destinations")
-async def get_destinations_endpoint():
-    """HTTP endpoint that calls MCP get_destinations tool"""
-    result = get_destinations()
-    return json.loads(result)
+async def get_destinations_endpoint(request: Request):
+    """HTTP endpoint that calls MCP get_destinations tool logic"""
+    return _cached_json_response(request, _DESTINATIONS_BODY, _DESTINATIONS_ETAG, "public, max-age=3600")
 
 @app.post("/api/player/move")
-async def move_player_endpoint(request: dict):
-    """HTTP endpoint that calls MCP move_player tool"""
-    destination = request.get("destination")
-    if not destination:
-        raise HTTPException(status_code=400, detail="Destination is required")
-    
-    result = move_player(destination)
-    return json.loads(result)
+async def move_player_endpoint(request: MoveRequest):
+    """HTTP endpoint that calls MCP move_player tool logic"""
+    return _move_player_dict(request.destination)
 
-@app.get("/api/player/status")
+@app.get("/api/player/status", response_class=ORJSONResponse, response_model=None)
 async def get_player_status_endpoint():
-    """HTTP endpoint that calls MCP get_player_status tool"""
-    result = get_player_status()
-    return json.loads(result)
+    """HTTP endpoint that calls MCP get_player_status tool logic"""
+    return await _get_player_status_dict()
 
 @app.post("/api/player/pensamento")
-async def pensamento_endpoint(request: dict):
-    """HTTP endpoint that calls MCP pensamento tool"""
-    texto = request.get("texto")
-    if not texto:
-        raise HTTPException(status_code=400, detail="Texto is required")
-    
-    result = pensamento(texto)
-    return json.loads(result)
+async def pensamento_endpoint(request: PensamentoRequest):
+    """HTTP endpoint that calls MCP pensamento tool logic"""
+    return _pensamento_dict(request.texto)
+
+# Scripts estáticos enviados ao frontend, definidos uma única vez
+# Captura e envia o status do player (helper definido no index.html)
+_JS_SEND_STATUS = "window.sendPlayerStatusToServer();"
+
+# Loga o estado do jogo no console e envia um status fictício para o servidor
+_JS_TEST = """
+console.log('=== TESTE DE EXECUÇÃO JAVASCRIPT ===');
+console.log('Timestamp:', new Date().toISOString());
+console.log('playerPosition existe?', typeof playerPosition !== 'undefined');
+if (typeof playerPosition !== 'undefined') {
+    console.log('playerPosition:', playerPosition);
+}
+console.log('mapGrid existe?', typeof mapGrid !== 'undefined');
+console.log('locations existe?', typeof locations !== 'undefined');
+
+// Tenta enviar um teste para o servidor
+fetch('/api/player/update-status', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ 
+        player_status: {
+            stamina: 999,
+            dinheiro_bolso: 999,
+            dinheiro_banco: 999,
+            coordenadas: { x: 999, y: 999 },
+            localizacao_atual: 'teste_js',
+            carros: 999
+        }
+    })
+})
+.then(response => console.log('Teste enviado:', response.status))
+.catch(error => console.error('Erro no teste:', error));
+"""
 
 @app.get("/api/player/real-status")
 async def get_real_player_status():
     """HTTP endpoint to get real player status from JavaScript"""
-    # Comando JavaScript para obter o status atual e retornar via fetch
-    js_command = """
-    if (typeof playerPosition !== 'undefined') {
-        // Detecta a localização atual baseada nas coordenadas
-        let currentLocation = 'desconhecido';
-        const currentTile = mapGrid[playerPosition.y] ? mapGrid[playerPosition.y][playerPosition.x] : ' ';
-        
-        // Verifica se está em uma localização específica
-        if (currentTile === 'H') {
-            currentLocation = 'casa';
-        } else if (currentTile === 'B') {
-            currentLocation = 'banco';
-        } else if (currentTile === 'M') {
-            currentLocation = 'mercado';
-        } else if (currentTile === 'W') {
-            currentLocation = 'trabalho';
-        } else if (currentTile === 'C') {
-            currentLocation = 'loja_carros';
-        } else {
-            // Verifica se está próximo de alguma localização
-            for (const [tile, location] of Object.entries(locations)) {
-                if (location.x === playerPosition.x && location.y === playerPosition.y) {
-                    switch(tile) {
-                        case 'B': currentLocation = 'banco'; break;
-                        case 'M': currentLocation = 'mercado'; break;
-                        case 'W': currentLocation = 'trabalho'; break;
-                        case 'C': currentLocation = 'loja_carros'; break;
-                        default: currentLocation = 'area_livre';
-                    }
-                    break;
-                }
-            }
-            if (currentLocation === 'desconhecido') {
-                currentLocation = 'area_livre';
-            }
-        }
-        
-        const statusData = {
-            stamina: playerPosition.stamina,
-            dinheiro_bolso: playerPosition.moneyInPocket,
-            dinheiro_banco: playerPosition.moneyInBank,
-            coordenadas: { x: playerPosition.x, y: playerPosition.y },
-            localizacao_atual: currentLocation,
-            carros: playerPosition.carros || 0
-        };
-        
-        // Envia o status para o servidor
-        fetch('/api/player/update-status', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ player_status: statusData })
-        }).catch(console.error);
-    }
-    """
-    
-    # Adiciona o comando à fila
-    js_commands.append({
-        "id": f"real_status_{int(time.time() * 1000)}",
-        "script": js_command,
-        "timestamp": time.time()
-    })
+    # Pede ao frontend para capturar e enviar o status atual
+    enqueue_js_command(_JS_SEND_STATUS, f"real_status_{next(_js_command_seq)}")
     
     # Retorna o último status conhecido ou padrão
     return {
@@ -464,12 +495,23 @@ last_player_status = {
     "carros": 0
 }
 
+# Sinaliza a chegada de um novo status enviado pelo frontend
+_status_updated = asyncio.Event()
+
+async def wait_for_status_update(timeout: float):
+    """Aguarda o frontend enviar um novo status ou o timeout expirar"""
+    try:
+        await asyncio.wait_for(_status_updated.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
 @app.post("/api/player/update-status")
 async def update_player_status(request: dict):
     """Endpoint para receber atualizações de status do JavaScript"""
     global last_player_status
     if "player_status" in request:
         last_player_status = request["player_status"]
+        _status_updated.set()
     return {"success": True, "message": "Status atualizado"}
 
 @app.get("/api/player/current-status")
@@ -480,162 +522,18 @@ async def get_current_player_status():
 @app.get("/api/player/request-status")
 async def request_player_status():
     """Solicita o status atual do jogador via JavaScript e retorna quando disponível"""
-    try:
-        # JavaScript para chamar a função sendPlayerStatusToServer com logs detalhados
-        js_code = """
-        console.log('=== API REQUEST STATUS INICIADO ===');
-        console.log('Verificando se sendPlayerStatusToServer existe:', typeof window.sendPlayerStatusToServer);
-        console.log('Verificando playerPosition:', window.playerPosition);
-        console.log('Verificando mapGrid:', window.mapGrid);
-        
-        if (typeof window.sendPlayerStatusToServer === 'function') {
-            console.log('Chamando sendPlayerStatusToServer...');
-            window.sendPlayerStatusToServer().then(result => {
-                console.log('Status solicitado via API - Resultado:', result);
-            }).catch(error => {
-                console.error('Erro ao solicitar status via API:', error);
-            });
-        } else {
-            console.error('Função sendPlayerStatusToServer não encontrada');
-            console.log('Tentando chamar getPlayerStatus diretamente...');
-            if (typeof window.getPlayerStatus === 'function') {
-                const status = window.getPlayerStatus();
-                console.log('Status obtido via getPlayerStatus:', status);
-                
-                // Envia manualmente para o servidor
-                fetch('/api/player/update-status', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ player_status: status })
-                }).then(response => response.json())
-                  .then(data => console.log('Status enviado manualmente:', data))
-                  .catch(error => console.error('Erro ao enviar status manualmente:', error));
-            }
-        }
-        """
-        
-        # Adiciona o comando JavaScript à fila
-        js_commands.append(js_code)
-        
-        # Aguarda mais tempo para o JavaScript executar
-        await asyncio.sleep(1.0)
-        
-        # Retorna o último status conhecido
-        return {"status": "success", "message": "Status solicitado com logs detalhados", "player_status": last_player_status}
-        
-    except Exception as e:
-        return {"status": "error", "message": str(e), "player_status": last_player_status}
+    return await _capture_live_status(timeout=1.0, message="Status solicitado com logs detalhados")
 
 @app.get("/api/player/live-status")
 async def get_live_player_status():
     """Força a captura do status atual do jogador via JavaScript"""
-    try:
-        # JavaScript para capturar status atual
-        js_code = """
-        (function() {
-            try {
-                let statusData = {
-                    stamina: 100,
-                    dinheiro_bolso: 0,
-                    dinheiro_banco: 0,
-                    coordenadas: { x: 1, y: 1 },
-                    localizacao_atual: 'casa',
-                    carros: 0
-                };
-                
-                // Verifica se playerPosition está disponível
-                if (typeof playerPosition !== 'undefined' && playerPosition) {
-                    statusData.stamina = playerPosition.stamina || 100;
-                    statusData.dinheiro_bolso = playerPosition.moneyInPocket || 0;
-                    statusData.dinheiro_banco = playerPosition.moneyInBank || 0;
-                    statusData.carros = playerPosition.carros || 0;
-                    statusData.coordenadas = { 
-                        x: playerPosition.x || 1, 
-                        y: playerPosition.y || 1 
-                    };
-                    
-                    // Detectar localização baseada no tile atual
-                    if (typeof mapGrid !== 'undefined' && mapGrid[playerPosition.y]) {
-                        const tile = mapGrid[playerPosition.y][playerPosition.x];
-                        switch(tile) {
-                            case 'H': statusData.localizacao_atual = 'casa'; break;
-                            case 'B': statusData.localizacao_atual = 'banco'; break;
-                            case 'M': statusData.localizacao_atual = 'mercado'; break;
-                            case 'W': statusData.localizacao_atual = 'trabalho'; break;
-                            case 'C': statusData.localizacao_atual = 'loja_carros'; break;
-                            default: statusData.localizacao_atual = 'area_livre';
-                        }
-                    }
-                }
-                
-                // Envia o status para o servidor
-                fetch('/api/player/update-status', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ player_status: statusData })
-                }).then(response => response.json())
-                  .then(data => console.log('Status atualizado:', data))
-                  .catch(error => console.error('Erro ao atualizar status:', error));
-                  
-                return statusData;
-            } catch (error) {
-                console.error('Erro ao capturar status:', error);
-                return null;
-            }
-        })();
-        """
-        
-        # Adiciona o comando JavaScript à fila
-        js_commands.append(js_code)
-        
-        # Aguarda um pouco para o JavaScript executar
-        await asyncio.sleep(0.5)
-        
-        # Retorna o último status conhecido
-        return {"status": "success", "player_status": last_player_status}
-        
-    except Exception as e:
-        return {"status": "error", "message": str(e), "player_status": last_player_status}
+    return await _capture_live_status(timeout=0.5)
 
 @app.get("/api/test-js")
 async def test_javascript():
     """Endpoint para testar se o JavaScript está sendo executado"""
-    # Comando JavaScript simples para teste
-    test_command = """
-    console.log('=== TESTE DE EXECUÇÃO JAVASCRIPT ===');
-    console.log('Timestamp:', new Date().toISOString());
-    console.log('playerPosition existe?', typeof playerPosition !== 'undefined');
-    if (typeof playerPosition !== 'undefined') {
-        console.log('playerPosition:', playerPosition);
-    }
-    console.log('mapGrid existe?', typeof mapGrid !== 'undefined');
-    console.log('locations existe?', typeof locations !== 'undefined');
-    
-    // Tenta enviar um teste para o servidor
-    fetch('/api/player/update-status', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ 
-            player_status: {
-                stamina: 999,
-                dinheiro_bolso: 999,
-                dinheiro_banco: 999,
-                coordenadas: { x: 999, y: 999 },
-                localizacao_atual: 'teste_js',
-                carros: 999
-            }
-        })
-    })
-    .then(response => console.log('Teste enviado:', response.status))
-    .catch(error => console.error('Erro no teste:', error));
-    """
-    
-    # Adiciona o comando à fila
-    js_commands.append({
-        "id": f"test_js_{int(time.time() * 1000)}",
-        "script": test_command,
-        "timestamp": time.time()
-    })
+    # Adiciona o comando de teste à fila
+    enqueue_js_command(_JS_TEST, f"test_js_{next(_js_command_seq)}")
     
     return {"message": "Comando de teste JavaScript adicionado à fila", "check_console": "Verifique o console do navegador para logs"}
 
@@ -646,136 +544,120 @@ async def gemini_endpoint(request: dict):
     if not contents:
         raise HTTPException(status_code=400, detail="Contents are required")
     
-    contents_json = json.dumps(contents)
-    result = generate_gemini_content(contents_json)
-    return json.loads(result)
-
-# Lista global para armazenar comandos JavaScript
-js_commands = []
-js_command_queue = []
+    return await _generate_gemini_content_dict(contents)
+
+# Cada aba do jogo (identificada pelo client_id do long-polling) tem sua própria fila de comandos
+# JavaScript, e cada comando é entregue uma vez para cada aba.
+# Limitada para não crescer sem fim se o navegador parar de consumir (descarta os mais antigos)
+JS_COMMAND_QUEUE_MAX = 2048
+# Máximo de comandos entregues ao frontend por polling
+JS_COMMAND_BATCH_MAX = 32
+# Comandos não entregues em até 30 segundos são descartados
+JS_COMMAND_TTL = 30
+# Tempo máximo que o long-polling do frontend fica aguardando (abaixo do limite de ociosidade de proxies)
+JS_LONG_POLL_TIMEOUT = 25.0
+# Abas que não fazem polling há mais que isso são consideradas fechadas
+JS_CLIENT_IDLE_TIMEOUT = 60.0
+# Resposta do long-polling sem comandos (o caso mais comum), serializada uma única vez
+_EMPTY_COMMANDS_RESPONSE = Response(content=b'{"commands":[]}', media_type="application/json")
+# Cabeçalhos das respostas com comandos, montados uma única vez
+_JSON_HEADERS = {"content-type": "application/json"}
+# Sequência para gerar ids únicos de comandos
+_js_command_seq = itertools.count()
+
+@dataclass(slots=True, frozen=True)
+class JsCommand:
+    """Comando JavaScript entregue ao frontend (imutável, compartilhado entre as filas das abas)"""
+    script: str
+    id: str | None = None
+
+class JsCommandClient:
+    """Fila de comandos JavaScript de uma aba do jogo"""
+    
+    def __init__(self):
+        # Itens (expira_em, comando), do mais antigo para o mais novo
+        self.queue: deque[tuple[float, JsCommand]] = deque(maxlen=JS_COMMAND_QUEUE_MAX)
+        # Sinaliza que há comandos novos na fila
+        self.event = asyncio.Event()
+        self.last_seen = time.monotonic()
+
+js_clients: dict[str, JsCommandClient] = {}
+
+# Comandos enfileirados enquanto nenhuma aba está conectada (página carregando, reload).
+# São entregues à primeira aba que se conectar; os expirados são descartados pelo mesmo TTL das filas
+_pending_js_commands: deque[tuple[float, JsCommand]] = deque(maxlen=JS_COMMAND_QUEUE_MAX)
+
+# Métricas opcionais (pip install prometheus_client), expostas em /metrics: a maior fila de
+# comandos entre as abas. Se chegar a JS_COMMAND_QUEUE_MAX, o frontend parou de consumir
+if importlib.util.find_spec("prometheus_client") is not None:
+    from prometheus_client import Gauge, make_asgi_app
+    
+    Gauge(
+        "rpg_js_command_queue_length",
+        "Maior fila de comandos JavaScript pendentes entre as abas do jogo"
+    ).set_function(lambda: max((len(client.queue) for client in js_clients.values()), default=0))
+    app.mount("/metrics", make_asgi_app())
+
+def enqueue_js_command(script: str, command_id: str | None = None) -> bool:
+    """Adiciona um comando JavaScript à fila de cada aba do jogo.
+    
+    Retorna True se alguma aba conectada recebeu o comando; sem abas, ele fica pendente
+    (até o TTL) para a próxima aba que se conectar.
+    
+    Deve rodar no loop do servidor (não é thread-safe): as filas são trocadas inteiras
+    na entrega e os eventos do asyncio não podem ser sinalizados de outro thread.
+    """
+    command = JsCommand(script=script, id=command_id)
+    
+    # Cada item da fila é (expira_em, comando). O prazo usa o relógio monotônico
+    # (ajustes no relógio do sistema não afetam a expiração) e é calculado uma única vez aqui
+    now = time.monotonic()
+    entry = (now + JS_COMMAND_TTL, command)
+    
+    # Descarta aqui também as abas fechadas, mesmo que nenhuma outra esteja fazendo polling
+    _evict_idle_js_clients(now)
+    
+    if not js_clients:
+        while _pending_js_commands and _pending_js_commands[0][0] < now:
+            _pending_js_commands.popleft()
+        _pending_js_commands.append(entry)
+        return False
+    
+    for client in js_clients.values():
+        client.queue.append(entry)
+        client.event.set()
+    return True
+
+def _evict_idle_js_clients(now: float):
+    """Remove as filas de abas que pararam de fazer polling"""
+    idle = [client_id for client_id, client in js_clients.items()
+            if now - client.last_seen > JS_CLIENT_IDLE_TIMEOUT]
+    for client_id in idle:
+        del js_clients[client_id]
 
 @app.post("/api/execute-js")
-async def execute_js_endpoint(request: dict):
+async def execute_js_endpoint(request: ExecuteJsRequest):
     """Endpoint para executar JavaScript no frontend"""
-    script = request.get("script")
-    if not script:
-        raise HTTPException(status_code=400, detail="script is required")
-    
     # Adiciona o comando à fila
-    js_command_queue.append({
-        "script": script,
-        "timestamp": time.time()
-    })
+    enqueue_js_command(request.script)
     
     return {"success": True, "message": "Script adicionado à fila de execução"}
 
-@app.get("/api/get-player-status-live")
-async def get_player_status_live():
-    """Endpoint que força a captura do status do jogador em tempo real via JavaScript"""
+async def _capture_live_status(timeout: float = 1.5,
+                               message: str = "Status capturado em tempo real") -> dict:
+    """Pede ao frontend o status atual e aguarda a resposta (no máximo timeout segundos)"""
     try:
-        # JavaScript que captura o status atual e o retorna via fetch
-        js_code = """
-        console.log('=== GET PLAYER STATUS LIVE INICIADO ===');
+        # Pede ao frontend para capturar e enviar o status atual
+        _status_updated.clear()
+        enqueue_js_command(_JS_SEND_STATUS)
         
-        // Função para capturar status atual
-        function captureCurrentStatus() {
-            let currentX = 1, currentY = 1, currentStamina = 100;
-            let currentMoney = 0, currentBankMoney = 0, currentCars = 0;
-            let currentLocation = 'casa';
-            
-            console.log('Verificando playerPosition:', window.playerPosition);
-            console.log('Verificando playerPosition global:', typeof playerPosition !== 'undefined' ? playerPosition : 'undefined');
-            
-            // Tenta múltiplas formas de acessar a posição do jogador
-            if (window.playerPosition) {
-                currentX = window.playerPosition.x;
-                currentY = window.playerPosition.y;
-                currentStamina = window.playerPosition.stamina || 100;
-                currentMoney = window.playerPosition.moneyInPocket || 0;
-                currentBankMoney = window.playerPosition.moneyInBank || 0;
-                currentCars = window.playerPosition.carros || 0;
-                console.log('LIVE - Usando window.playerPosition:', window.playerPosition);
-            } else if (typeof playerPosition !== 'undefined') {
-                currentX = playerPosition.x;
-                currentY = playerPosition.y;
-                currentStamina = playerPosition.stamina || 100;
-                currentMoney = playerPosition.moneyInPocket || 0;
-                currentBankMoney = playerPosition.moneyInBank || 0;
-                currentCars = playerPosition.carros || 0;
-                console.log('LIVE - Usando playerPosition global:', playerPosition);
-            } else {
-                console.log('LIVE - playerPosition não encontrado, usando valores padrão');
-            }
-            
-            // Detecta localização baseada no tile
-            if (window.mapGrid && window.mapGrid[currentY] && window.mapGrid[currentY][currentX]) {
-                const tile = window.mapGrid[currentY][currentX];
-                console.log('LIVE - Tile detectado:', tile, 'na posição:', currentX, currentY);
-                switch(tile) {
-                    case 'H': currentLocation = 'casa'; break;
-                    case 'B': currentLocation = 'banco'; break;
-                    case 'M': currentLocation = 'mercado'; break;
-                    case 'W': currentLocation = 'trabalho'; break;
-                    case 'C': currentLocation = 'loja_carros'; break;
-                    default: currentLocation = 'area_livre';
-                }
-            } else if (typeof mapGrid !== 'undefined' && mapGrid[currentY] && mapGrid[currentY][currentX]) {
-                const tile = mapGrid[currentY][currentX];
-                console.log('LIVE - Tile detectado via mapGrid global:', tile);
-                switch(tile) {
-                    case 'H': currentLocation = 'casa'; break;
-                    case 'B': currentLocation = 'banco'; break;
-                    case 'M': currentLocation = 'mercado'; break;
-                    case 'W': currentLocation = 'trabalho'; break;
-                    case 'C': currentLocation = 'loja_carros'; break;
-                    default: currentLocation = 'area_livre';
-                }
-            }
-            
-            const statusData = {
-                stamina: currentStamina,
-                dinheiro_bolso: currentMoney,
-                dinheiro_banco: currentBankMoney,
-                coordenadas: { x: currentX, y: currentY },
-                localizacao_atual: currentLocation,
-                carros: currentCars,
-                timestamp: new Date().toISOString()
-            };
-            
-            console.log('LIVE - Status capturado:', statusData);
-            return statusData;
-        }
-        
-        // Captura o status e envia para o servidor
-        const status = captureCurrentStatus();
-        
-        // Envia o status atualizado para o servidor
-        fetch('/api/player/update-status', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ player_status: status })
-        }).then(response => response.json())
-          .then(data => {
-              console.log('LIVE - Status enviado com sucesso:', data);
-              // Marca que o status foi atualizado
-              window.lastStatusUpdate = status;
-          })
-          .catch(error => console.error('LIVE - Erro ao enviar status:', error));
-        """
-        
-        # Adiciona o comando JavaScript à fila
-        js_command_queue.append({
-            "script": js_code,
-            "timestamp": time.time()
-        })
-        
-        # Aguarda o JavaScript executar
-        await asyncio.sleep(1.5)
+        # Aguarda o frontend enviar o status
+        await wait_for_status_update(timeout=timeout)
         
         # Retorna o último status atualizado
         return {
             "status": "success", 
-            "message": "Status capturado em tempo real", 
+            "message": message, 
             "player_status": last_player_status,
             "timestamp": time.time()
         }
@@ -787,37 +669,135 @@ async def get_player_status_live():
             "player_status": last_player_status
         }
 
-@app.get("/api/js-commands")
-async def get_js_commands():
-    """Endpoint para o frontend buscar comandos JavaScript pendentes"""
-    global js_command_queue
+# Cache da última captura em tempo real: (expira_em, payload, corpo JSON, ETag).
+# Pedidos em rajada reaproveitam a mesma captura em vez de disparar uma nova cada um
+LIVE_STATUS_TTL = 0.25
+_live_status_cache: tuple[float, dict, bytes, str] | None = None
+_live_status_task: asyncio.Task | None = None
+
+async def _live_status() -> tuple[dict, bytes, str]:
+    """Retorna a captura em cache ou aguarda uma nova (compartilhada entre pedidos simultâneos)"""
+    global _live_status_cache, _live_status_task
     
-    # Remove comandos antigos (mais de 30 segundos)
-    current_time = time.time()
-    js_command_queue = [cmd for cmd in js_command_queue if current_time - cmd["timestamp"] < 30]
+    if _live_status_cache is not None and time.monotonic() < _live_status_cache[0]:
+        return _live_status_cache[1:]
     
-    # Retorna todos os comandos pendentes e limpa a fila
-    commands = js_command_queue.copy()
-    js_command_queue.clear()
+    if _live_status_task is None or _live_status_task.done():
+        _live_status_task = asyncio.ensure_future(_capture_live_status())
+    payload = await asyncio.shield(_live_status_task)
     
-    return {"commands": commands}
-
-def run_fastapi():
-    """Run FastAPI server in a separate thread"""
-    uvicorn.run(app, host="127.0.0.1", port=8080)
+    # Só a primeira requisição que acordar com esta captura serializa e guarda no cache
+    if _live_status_cache is None or _live_status_cache[1] is not payload:
+        body = orjson.dumps(payload)
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        _live_status_cache = (time.monotonic() + LIVE_STATUS_TTL, payload, body, etag)
+    return _live_status_cache[1:]
+
+@app.get("/api/get-player-status-live", response_class=ORJSONResponse, response_model=None)
+async def get_player_status_live(request: Request):
+    """Endpoint que força a captura do status do jogador em tempo real via JavaScript"""
+    _, body, etag = await _live_status()
+    return _cached_json_response(request, body, etag, "no-cache")
+
+@app.get("/api/js-commands", response_class=ORJSONResponse, response_model=None)
+async def get_js_commands(client_id: str):
+    """Endpoint de long-polling para o frontend buscar comandos JavaScript pendentes"""
+    now = time.monotonic()
+    _evict_idle_js_clients(now)
+    
+    client = js_clients.get(client_id)
+    if client is None:
+        client = js_clients[client_id] = JsCommandClient()
+        # Recebe os comandos enfileirados enquanto nenhuma aba estava conectada (uma única vez,
+        # para que outras abas abertas ou recarregadas depois não os executem de novo)
+        client.queue.extend(_pending_js_commands)
+        _pending_js_commands.clear()
+    client.last_seen = now
+    
+    # Os comandos entram em ordem de chegada, então os expirados estão sempre no início da fila
+    queue = client.queue
+    while queue and queue[0][0] < now:
+        queue.popleft()
+    
+    # Sem comandos: segura a requisição até chegar um novo comando ou o timeout expirar
+    if not client.queue:
+        client.event.clear()
+        try:
+            await asyncio.wait_for(client.event.wait(), timeout=JS_LONG_POLL_TIMEOUT)
+        except asyncio.TimeoutError:
+            return _EMPTY_COMMANDS_RESPONSE
+    
+    # Caso comum: entrega a fila inteira trocando-a por uma nova, sem retirar item a item
+    if len(client.queue) <= JS_COMMAND_BATCH_MAX:
+        batch, client.queue = client.queue, deque(maxlen=JS_COMMAND_QUEUE_MAX)
+        client.event.clear()
+        # O orjson serializa os JsCommand (dataclass) direto, sem passar pelo jsonable_encoder
+        return Response(content=orjson.dumps({"commands": [command for _, command in batch]}),
+                        headers=_JSON_HEADERS)
+    
+    # Fila maior que o lote: entrega só o limite e o resto fica para o próximo polling
+    commands = []
+    while client.queue and len(commands) < JS_COMMAND_BATCH_MAX:
+        commands.append(client.queue.popleft()[1])
+    
+    return Response(content=orjson.dumps({"commands": commands}), headers=_JSON_HEADERS)
 
-def run_mcp():
-    """Run MCP server in a separate thread"""
-    mcp.run(transport="sse")
+@app.post("/api/js-commands/unregister")
+async def unregister_js_client(client_id: str):
+    """Endpoint chamado pelo frontend (sendBeacon) ao fechar ou recarregar a aba"""
+    client = js_clients.pop(client_id, None)
+    
+    # Sem outras abas, os comandos que a aba não chegou a buscar voltam a ficar pendentes
+    # para a próxima que se conectar (ex.: a mesma página recarregada)
+    if client is not None and not js_clients:
+        now = time.monotonic()
+        _pending_js_commands.extend(entry for entry in client.queue if entry[0] >= now)
+    
+    return {"success": True}
+
+# Servidor MCP (SSE) montado no próprio FastAPI: um único processo e um único loop de eventos
+# para o jogo e para as ferramentas MCP, que compartilham a fila de comandos e o status do player
+app.mount("/mcp", mcp.sse_app())
+
+def run_server():
+    """Run the FastAPI server (game + MCP)"""
+    # "auto" usa uvloop e httptools quando instalados (uvicorn[standard]),
+    # caindo para asyncio/h11 onde não estão disponíveis (ex.: Windows)
+    config = uvicorn.Config(
+        app,
+        host="127.0.0.1",
+        port=8080,
+        loop="auto",
+        http="auto",
+        # O lifespan do app fecha o cliente da API Gemini ao encerrar o servidor
+        lifespan="on",
+        # Sem o dictConfig padrão do uvicorn (que põe um StreamHandler síncrono nos loggers dele):
+        # os logs do uvicorn propagam para os handlers do logger raiz
+        log_config=None,
+        log_level="warning",
+        access_log=False,
+        # Mantém a conexão do long-polling aberta entre os pollings do frontend
+        # (o asyncio e o uvloop já desativam o Nagle, TCP_NODELAY, nos sockets aceitos)
+        timeout_keep_alive=75
+    )
+    uvicorn.Server(config).run()
 
 if __name__ == "__main__":
-    print("Starting Hybrid Server (FastAPI + MCP)...")
-    print("FastAPI: http://127.0.0.1:8080")
-    print("MCP: SSE transport")
+    # Os logs (inclusive os do uvicorn, que propagam para o logger raiz) são escritos no
+    # terminal por um thread separado, para que o loop de eventos nunca fique bloqueado em
+    # escrita síncrona. force=True substitui o StreamHandler que o FastMCP já instalou no
+    # logger raiz ao ser criado
+    log_queue = SimpleQueue()
+    logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)], force=True)
+    log_listener = QueueListener(log_queue, logging.StreamHandler())
+    log_listener.start()
     
-    # Start FastAPI in a separate thread
-    fastapi_thread = threading.Thread(target=run_fastapi, daemon=True)
-    fastapi_thread.start()
+    logger.info("Starting Hybrid Server (FastAPI + MCP)...")
+    logger.info("FastAPI: http://127.0.0.1:8080")
+    logger.info("MCP: SSE transport em http://127.0.0.1:8080/mcp/sse")
     
-    # Run MCP in main thread
-    run_mcp()
+    try:
+        # Um único worker: a fila de comandos JavaScript e o status do player vivem em memória
+        run_server()
+    finally:
+        log_listener.stop()